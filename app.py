@@ -1,33 +1,59 @@
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
+from werkzeug.utils import secure_filename
 from langchain.agents import AgentExecutor, create_openai_tools_agent
 from langchain.tools import tool
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain.schema import AgentAction, SystemMessage
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
 import json
-from datetime import datetime, timedelta
+import re
+from datetime import date, datetime, timedelta
 import os
+import logging
 from dotenv import load_dotenv
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
 import io
+import mimetypes
+import shutil
 import base64
-import uuid
+import time
+import threading
+from functools import lru_cache, partial
+from operator import itemgetter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from ulid import ULID
 from mcp_client import get_mcp_client
 
 # 加载环境变量
 load_dotenv()
 
+# 日志配置（默认 INFO，调试时可设置 LOG_LEVEL=DEBUG 查看 Agent 执行细节）
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+# httpx 在 INFO 级别为每个 LLM/MCP 请求记录一行日志，只保留警告
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("httpcore").setLevel(logging.WARNING)
+
 # 加载画图配置
 def load_image_config():
     """加载千问AI画图配置"""
     try:
-        with open('config.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open('config.json', 'rb') as f:
+            return orjson.loads(f.read())
     except Exception as e:
-        print(f"加载配置文件失败: {e}")
+        logger.warning("加载配置文件失败: %s", e)
         return None
 
 IMAGE_CONFIG = load_image_config()
@@ -35,68 +61,148 @@ IMAGE_CONFIG = load_image_config()
 # 创建图片保存目录
 if IMAGE_CONFIG:
     IMAGES_DIR = IMAGE_CONFIG.get('save_directory', './generated_images')
-    Path(IMAGES_DIR).mkdir(parents=True, exist_ok=True)
+    IMAGES_PATH = Path(IMAGES_DIR)
+    IMAGES_PATH.mkdir(parents=True, exist_ok=True)
+    IMAGE_FORMAT = IMAGE_CONFIG.get('save_format', 'png')
+
+# 画图任务轮询：总等待时长上限（秒）及退避参数
+IMAGE_POLL_TIMEOUT = 60
+IMAGE_POLL_INITIAL_DELAY = 1.5
+IMAGE_POLL_MAX_DELAY = 8
+
+# 图片下载：分块读取大小与文件写缓冲大小
+IMAGE_CHUNK_SIZE = 64 * 1024
+IMAGE_WRITE_BUFFER = 1024 * 1024
+
+# 生成的图片文件名唯一且内容不变，浏览器可长期缓存（秒）
+IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600
+
+# 部署在 nginx 之后时，图片交由 nginx 通过 X-Accel-Redirect 直接发送
+USE_XACCEL = os.getenv("USE_XACCEL", "").lower() in ("1", "true", "yes")
+XACCEL_IMAGES_PREFIX = os.getenv("XACCEL_IMAGES_PREFIX", "/_generated_images/")
+
+# 天气查询辅助线程池（用于并发发起实时天气与预报两次 MCP 调用）
+WEATHER_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mcp-weather")
+
+# 复用的 HTTP 会话（连接池保持长连接，避免每次请求重新握手；
+# 对幂等请求的 5xx 响应自动重试，POST 提交任务不重试）
+HTTP_SESSION = requests.Session()
+_http_adapter = HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[500, 502, 503, 504],
+        raise_on_status=False
+    )
+)
+HTTP_SESSION.mount("https://", _http_adapter)
+HTTP_SESSION.mount("http://", _http_adapter)
+
+
+# 使用 orjson 作为 Flask 的 JSON 序列化实现（jsonify / request.get_json）
+class OrjsonProvider(JSONProvider):
+    """基于 orjson 的 JSON Provider，默认输出 UTF-8，无需 ensure_ascii"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
+app.json_provider_class = OrjsonProvider
+app.json = OrjsonProvider(app)
 CORS(app)
 
-# 模拟员工日程数据
-def generate_schedule_data(department=None):
-    """生成模拟的员工日程数据"""
-    departments = {
-        "技术部": [
-            {"name": "张三", "position": "高级工程师", "tasks": ["开发新功能模块", "代码审查", "技术文档编写"]},
-            {"name": "李四", "position": "前端工程师", "tasks": ["UI界面优化", "响应式布局调整", "前端性能优化"]},
-            {"name": "王五", "position": "后端工程师", "tasks": ["API接口开发", "数据库优化", "服务器维护"]},
-        ],
-        "市场部": [
-            {"name": "赵六", "position": "市场经理", "tasks": ["市场调研", "营销方案策划", "客户拜访"]},
-            {"name": "钱七", "position": "市场专员", "tasks": ["社交媒体运营", "活动策划执行", "数据分析报告"]},
-        ],
-        "人事部": [
-            {"name": "孙八", "position": "人事经理", "tasks": ["招聘面试", "员工培训", "绩效考核"]},
-            {"name": "周九", "position": "人事专员", "tasks": ["员工档案管理", "考勤统计", "福利发放"]},
-        ],
-        "财务部": [
-            {"name": "吴十", "position": "财务经理", "tasks": ["财务报表审核", "预算编制", "税务申报"]},
-            {"name": "郑十一", "position": "会计", "tasks": ["日常账务处理", "发票管理", "费用报销审核"]},
-        ]
-    }
+# 响应压缩：仅压缩 JSON / HTML 等文本响应，图片本身已压缩，不再处理
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 512
+app.config['COMPRESS_MIMETYPES'] = [
+    'application/json',
+    'text/html',
+    'text/css',
+    'application/javascript',
+]
+Compress(app)
+
+# 模拟员工数据
+DEPARTMENTS = {
+    "技术部": [
+        {"name": "张三", "position": "高级工程师", "tasks": ["开发新功能模块", "代码审查", "技术文档编写"]},
+        {"name": "李四", "position": "前端工程师", "tasks": ["UI界面优化", "响应式布局调整", "前端性能优化"]},
+        {"name": "王五", "position": "后端工程师", "tasks": ["API接口开发", "数据库优化", "服务器维护"]},
+    ],
+    "市场部": [
+        {"name": "赵六", "position": "市场经理", "tasks": ["市场调研", "营销方案策划", "客户拜访"]},
+        {"name": "钱七", "position": "市场专员", "tasks": ["社交媒体运营", "活动策划执行", "数据分析报告"]},
+    ],
+    "人事部": [
+        {"name": "孙八", "position": "人事经理", "tasks": ["招聘面试", "员工培训", "绩效考核"]},
+        {"name": "周九", "position": "人事专员", "tasks": ["员工档案管理", "考勤统计", "福利发放"]},
+    ],
+    "财务部": [
+        {"name": "吴十", "position": "财务经理", "tasks": ["财务报表审核", "预算编制", "税务申报"]},
+        {"name": "郑十一", "position": "会计", "tasks": ["日常账务处理", "发票管理", "费用报销审核"]},
+    ]
+}
+
+# 日程模板：启动时展开静态字段，每条记录附带日期偏移（天），调用时只需填入日期
+_SCHEDULE_TEMPLATE = {
+    dept_name: [
+        (i, {
+            "department": dept_name,
+            "employee_name": emp["name"],
+            "position": emp["position"],
+            "date": None,
+            "task": task,
+            "status": "进行中" if i == 0 else "待开始",
+            "priority": "高" if i == 0 else "中"
+        })
+        for emp in employees
+        for i, task in enumerate(emp["tasks"])
+    ]
+    for dept_name, employees in DEPARTMENTS.items()
+}
+_SCHEDULE_DAYS = max(i for entries in _SCHEDULE_TEMPLATE.values() for i, _ in entries) + 1
+
+
+@lru_cache(maxsize=32)
+def _build_schedule_data(department, day):
+    """按（部门, 日期）生成日程数据，日期变化后自然失效"""
+    dates = [(day + timedelta(days=d)).strftime("%Y-%m-%d") for d in range(_SCHEDULE_DAYS)]
+    target_deps = _SCHEDULE_TEMPLATE if department == "全体" else {department: _SCHEDULE_TEMPLATE[department]}
     
-    today = datetime.now()
-    schedule_data = []
-    
-    # 根据部门筛选
-    if department and department != "全体":
-        if department in departments:
-            target_deps = {department: departments[department]}
-        else:
-            return {"error": f"未找到部门: {department}", "available_departments": list(departments.keys())}
-    else:
-        target_deps = departments
-    
-    for dept_name, employees in target_deps.items():
-        for emp in employees:
-            for i, task in enumerate(emp["tasks"]):
-                schedule_date = today + timedelta(days=i)
-                schedule_data.append({
-                    "department": dept_name,
-                    "employee_name": emp["name"],
-                    "position": emp["position"],
-                    "date": schedule_date.strftime("%Y-%m-%d"),
-                    "task": task,
-                    "status": "进行中" if i == 0 else "待开始",
-                    "priority": "高" if i == 0 else "中"
-                })
+    schedule_data = [
+        {**entry, "date": dates[offset]}
+        for entries in target_deps.values()
+        for offset, entry in entries
+    ]
     
     return {
         "success": True,
         "total_count": len(schedule_data),
-        "query_department": department if department else "全体",
+        "query_department": department,
         "schedules": schedule_data
     }
 
 
+# 模拟员工日程数据
+def generate_schedule_data(department=None):
+    """生成模拟的员工日程数据"""
+    # 根据部门筛选
+    if department and department != "全体":
+        if department not in _SCHEDULE_TEMPLATE:
+            return {"error": f"未找到部门: {department}", "available_departments": list(DEPARTMENTS.keys())}
+    else:
+        department = "全体"
+    
+    # 返回浅拷贝，避免调用方修改缓存中的顶层字段
+    return dict(_build_schedule_data(department, date.today()))
+
+
 # Flask 接口：获取员工日程表
 @app.route('/api/employee-schedule', methods=['POST'])
 def get_employee_schedule():
@@ -124,20 +230,11 @@ def get_company_schedule(department: str = "全体") -> str:
         JSON格式的员工日程数据
     """
     try:
-        # 调用内部接口
-        response = requests.post(
-            'http://localhost:5000/api/employee-schedule',
-            json={"department": department},
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            return json.dumps(data, ensure_ascii=False, indent=2)
-        else:
-            return f"获取日程失败，状态码: {response.status_code}"
+        # 进程内直接调用，无需经过 /api/employee-schedule 的 HTTP 往返
+        data = generate_schedule_data(department)
+        return orjson.dumps(data).decode()
     except Exception as e:
-        return f"调用接口出错: {str(e)}"
+        return f"获取日程出错: {str(e)}"
 
 
 @tool
@@ -152,7 +249,7 @@ def generate_image(prompt: str) -> str:
         JSON格式的图片信息，包含图片ID和URL
     """
     if not IMAGE_CONFIG:
-        return json.dumps({"error": "画图配置未加载"}, ensure_ascii=False)
+        return orjson.dumps({"error": "画图配置未加载"}).decode()
     
     try:
         # 千问AI画图API配置
@@ -179,26 +276,29 @@ def generate_image(prompt: str) -> str:
         }
         
         # 提交任务
-        response = requests.post(endpoint, headers=headers, json=params, timeout=30)
+        response = HTTP_SESSION.post(endpoint, headers=headers, json=params, timeout=30)
         result = response.json()
         
         if response.status_code != 200:
-            return json.dumps({"error": f"API调用失败: {result}"}, ensure_ascii=False)
+            return orjson.dumps({"error": f"API调用失败: {result}"}).decode()
         
         # 获取任务ID
         task_id = result.get('output', {}).get('task_id')
         if not task_id:
-            return json.dumps({"error": "未获取到任务ID"}, ensure_ascii=False)
+            return orjson.dumps({"error": "未获取到任务ID"}).decode()
         
-        # 查询任务结果（轮询）
+        # 查询任务结果（指数退避轮询）
         query_url = f"https://dashscope.aliyuncs.com/api/v1/tasks/{task_id}"
-        max_retries = 30
-        
-        for i in range(max_retries):
-            import time
-            time.sleep(2)  # 等待2秒
+        query_headers = {'Authorization': f'Bearer {api_key}'}
+        deadline = time.monotonic() + IMAGE_POLL_TIMEOUT
+        attempt = 0
+        
+        while time.monotonic() < deadline:
+            delay = min(IMAGE_POLL_INITIAL_DELAY * (1.3 ** attempt), IMAGE_POLL_MAX_DELAY)
+            time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+            attempt += 1
             
-            query_response = requests.get(query_url, headers={'Authorization': f'Bearer {api_key}'})
+            query_response = HTTP_SESSION.get(query_url, headers=query_headers, timeout=10)
             query_result = query_response.json()
             
             task_status = query_result.get('output', {}).get('task_status')
@@ -208,37 +308,73 @@ def generate_image(prompt: str) -> str:
                 image_url = query_result.get('output', {}).get('results', [{}])[0].get('url')
                 
                 if not image_url:
-                    return json.dumps({"error": "未获取到图片URL"}, ensure_ascii=False)
-                
-                # 下载图片
-                image_response = requests.get(image_url, timeout=30)
-                if image_response.status_code != 200:
-                    return json.dumps({"error": "图片下载失败"}, ensure_ascii=False)
+                    return orjson.dumps({"error": "未获取到图片URL"}).decode()
                 
                 # 保存图片
-                image_id = str(uuid.uuid4())
-                image_filename = f"{image_id}.{IMAGE_CONFIG['save_format']}"
-                image_path = os.path.join(IMAGES_DIR, image_filename)
+                # 使用 ULID 作为图片ID：唯一且按生成时间有序，便于按时间列出和清理
+                image_id = str(ULID())
+                image_filename = f"{image_id}.{IMAGE_FORMAT}"
+                image_path = IMAGES_PATH / image_filename
                 
-                with open(image_path, 'wb') as f:
-                    f.write(image_response.content)
+                # 下载图片（流式写入同目录下的临时文件，完整下载后再原子重命名，
+                # 中途失败不会留下不完整的图片）
+                with HTTP_SESSION.get(image_url, stream=True, timeout=30) as image_response:
+                    if image_response.status_code != 200:
+                        return orjson.dumps({"error": "图片下载失败"}).decode()
+                    
+                    image_response.raw.decode_content = True
+                    partial_path = image_path.with_name(f".{image_filename}.part")
+                    try:
+                        with open(partial_path, 'wb', buffering=IMAGE_WRITE_BUFFER) as f:
+                            shutil.copyfileobj(image_response.raw, f, length=IMAGE_CHUNK_SIZE)
+                        os.replace(partial_path, image_path)
+                    except BaseException:
+                        partial_path.unlink(missing_ok=True)
+                        raise
                 
                 # 返回图片信息
-                return json.dumps({
+                return orjson.dumps({
                     "success": True,
                     "image_id": image_id,
                     "filename": image_filename,
                     "url": f"/api/images/{image_filename}",
                     "prompt": prompt
-                }, ensure_ascii=False)
+                }).decode()
             
             elif task_status == 'FAILED':
-                return json.dumps({"error": "图片生成失败"}, ensure_ascii=False)
+                return orjson.dumps({"error": "图片生成失败"}).decode()
         
-        return json.dumps({"error": "图片生成超时"}, ensure_ascii=False)
+        return orjson.dumps({"error": "图片生成超时"}).decode()
         
     except Exception as e:
-        return json.dumps({"error": f"生成图片时出错: {str(e)}"}, ensure_ascii=False)
+        return orjson.dumps({"error": f"生成图片时出错: {str(e)}"}).decode()
+
+
+def filter_forecast(result, filter_indices):
+    """按 filter_indices 筛选预报结果中的 forecasts（原地修改）"""
+    if not (result.get('success') and result.get('type') == 'forecast'):
+        return result
+    
+    try:
+        original_forecasts = result.get('forecasts', [])
+        n = len(original_forecasts)
+        
+        # 解析索引：去重并保持顺序，显式丢弃越界（含负数）索引
+        parsed = dict.fromkeys(int(x) for x in filter_indices.replace(' ', '').split(',') if x)
+        indices = [i for i in parsed if 0 <= i < n]
+        
+        if len(indices) > 1:
+            filtered_forecasts = list(itemgetter(*indices)(original_forecasts))
+        else:
+            filtered_forecasts = [original_forecasts[i] for i in indices]
+        
+        result['forecasts'] = filtered_forecasts
+        result['filtered'] = True
+        logger.debug("✅ 筛选后返回 %d 天数据（索引: %s）", len(filtered_forecasts), indices)
+    except ValueError as e:
+        logger.warning("⚠️ 筛选失败: %s，返回完整数据", e)
+    
+    return result
 
 
 @tool
@@ -279,9 +415,7 @@ def query_weather(city: str, forecast: bool = False, filter_indices: str = None)
     """
     weather_type = "预报天气" if forecast else "实时天气"
     filter_info = f"（筛选: {filter_indices}）" if filter_indices else "（完整数据）"
-    print(f"🔄 通过 MCP 协议查询{weather_type}{filter_info}: {city}")
-    
-    import json
+    logger.debug("🔄 通过 MCP 协议查询%s%s: %s", weather_type, filter_info, city)
     
     # 获取 MCP 客户端（连接到远程 FastMCP 服务器）
     client = get_mcp_client("http://localhost:8001")
@@ -293,25 +427,55 @@ def query_weather(city: str, forecast: bool = False, filter_indices: str = None)
         result = client.query_current_weather(city)
     
     # 如果是预报天气且指定了筛选索引，进行筛选
-    if forecast and filter_indices and result.get('success') and result.get('type') == 'forecast':
-        try:
-            indices = [int(idx.strip()) for idx in filter_indices.split(',')]
-            original_forecasts = result.get('forecasts', [])
-            filtered_forecasts = [original_forecasts[i] for i in indices if i < len(original_forecasts)]
-            result['forecasts'] = filtered_forecasts
-            result['filtered'] = True
-            print(f"✅ 筛选后返回 {len(filtered_forecasts)} 天数据（索引: {indices}）")
-        except Exception as e:
-            print(f"⚠️ 筛选失败: {e}，返回完整数据")
+    if forecast and filter_indices:
+        filter_forecast(result, filter_indices)
+    
+    return orjson.dumps(result).decode()
+
+
+@tool
+def query_weather_full(city: str, filter_indices: str = None) -> str:
+    """
+    同时查询指定城市的实时天气和未来天气预报（两次 MCP 调用并发执行）
     
-    return json.dumps(result, ensure_ascii=False)
+    当用户在一个问题中同时询问当前天气和未来天气时使用，
+    例如"北京今天和未来三天的天气"，一次调用即可拿到两部分数据。
+    
+    参数:
+        city: 城市名称，如：北京、上海、广州
+        filter_indices: 可选，筛选预报部分要展示的天数，格式与 query_weather 相同
+                 - 如 "0,1,2" 表示前3天；不传或传 None 返回所有预报数据
+    
+    返回:
+        JSON格式的天气信息
+        {type: "full", city, current: {实时天气}, forecast: {预报天气}}
+    """
+    filter_info = f"（筛选: {filter_indices}）" if filter_indices else "（完整数据）"
+    logger.debug("🔄 通过 MCP 协议并发查询实时天气和预报天气%s: %s", filter_info, city)
+    
+    client = get_mcp_client("http://localhost:8001")
+    
+    # 实时天气在后台线程查询，同时在当前线程查询预报，总耗时取两者中较长的一次
+    current_future = WEATHER_EXECUTOR.submit(client.query_current_weather, city)
+    forecast = client.query_weather_forecast(city)
+    current = current_future.result()
+    
+    if filter_indices:
+        filter_forecast(forecast, filter_indices)
+    
+    return orjson.dumps({
+        "success": bool(current.get('success') or forecast.get('success')),
+        "type": "full",
+        "city": current.get('city') or forecast.get('city') or city,
+        "current": current,
+        "forecast": forecast
+    }).decode()
 
 
 # 初始化 DeepSeek LLM
 def init_llm():
     """初始化 DeepSeek 大模型"""
     api_key = os.getenv('DEEPSEEK_API_KEY')
-    print(f"DEEPSEEK_API_KEY: {api_key}")
     if not api_key:
         raise ValueError("请设置 DEEPSEEK_API_KEY 环境变量")
     
@@ -326,17 +490,11 @@ def init_llm():
     return llm
 
 
-# 创建 Agent
-def create_agent():
-    """创建 LangChain Agent"""
-    llm = init_llm()
-    
-    # 定义工具列表
-    tools = [get_company_schedule, generate_image, query_weather]
-    
-    # 创建 Prompt
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """你是一个专业的AI助手，可以进行普通对话，也具备特殊功能。
+# 工具列表
+AGENT_TOOLS = [get_company_schedule, generate_image, query_weather, query_weather_full]
+
+# 系统提示词（不含模板变量，直接作为 SystemMessage 使用，无需模板解析）
+SYSTEM_PROMPT = """你是一个专业的AI助手，可以进行普通对话，也具备特殊功能。
 
 💬 **普通对话能力**：
 - 可以回答各种问题：编程、知识问答、写作等
@@ -376,32 +534,253 @@ def create_agent():
       1. 在文本回答中，详细说明用户要求的天数的天气情况
       2. 同时传递 filter_indices，让前端卡片展示与你的文字说明一致
       3. 这样用户看到的文字和卡片就完全对应了
+  - **实时+预报**: query_weather_full(city="城市名", filter_indices="索引")
+    * 用户同时询问当前天气和未来天气时使用（如"今天和未来三天"），一次调用返回两部分数据
+    * filter_indices 规则与上面相同，只作用于预报部分
 
 **决策原则**：
 1. 编程、知识类问题 → 直接回答
 2. 日程查询 → 使用 get_company_schedule
 3. 画图请求 → 使用 generate_image
-4. 天气查询 → 使用 query_weather
+4. 天气查询 → 使用 query_weather；同时问当前和未来天气 → 使用 query_weather_full
 5. 不确定时 → 直接回答
 
-请用中文回复，保持友好和专业。"""),
-        ("human", "{input}"),
-        MessagesPlaceholder(variable_name="agent_scratchpad"),
-    ])
+请用中文回复，保持友好和专业。"""
+
+# Agent Prompt（启动时构建一次）
+AGENT_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content=SYSTEM_PROMPT),
+    ("human", "{input}"),
+    MessagesPlaceholder(variable_name="agent_scratchpad"),
+])
+
+
+# 工具并发执行线程池（工具均为 I/O 密集型 HTTP 调用，线程即可）
+# 每步的第一个工具在请求线程中执行，线程池只承担同一步中额外的工具调用，
+# 默认与 gunicorn 每个进程的请求线程数一致
+TOOL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TOOL_CONCURRENCY_LIMIT", os.getenv("GUNICORN_THREADS", "16"))),
+    thread_name_prefix="agent-tool"
+)
+
+
+class _PrefetchedTool:
+    """替代原工具传给 AgentExecutor，按调用顺序返回已在线程池中执行的结果"""
+    
+    def __init__(self, tool, results):
+        self.return_direct = tool.return_direct
+        self._results = results
+    
+    def run(self, *args, **kwargs):
+        return self._results.popleft()()
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """
+    并行执行同一步中的多个工具调用
+    
+    LLM 在一步中返回多个工具调用时（如同时查询天气和日程），
+    默认的 AgentExecutor 会逐个串行执行。AgentExecutor 会先产出本步的
+    全部 AgentAction 再依次执行工具：第一个工具留在请求线程中执行，
+    其余的在产出时立即提交到线程池，随后按原顺序取回结果，
+    总耗时从各工具耗时之和变为其中的最大值。只调用一个工具的步骤不经过线程池。
+    """
+    
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        results = deque()
+        prefetched_tools = {
+            name: _PrefetchedTool(tool, results) for name, tool in name_to_tool_map.items()
+        }
+        
+        for item in super()._iter_next_step(
+            prefetched_tools, color_mapping, inputs, intermediate_steps, run_manager
+        ):
+            if isinstance(item, AgentAction) and item.tool in name_to_tool_map:
+                tool_call = partial(
+                    self._run_tool,
+                    name_to_tool_map[item.tool],
+                    item,
+                    color_mapping[item.tool],
+                    run_manager
+                )
+                if results:
+                    results.append(TOOL_EXECUTOR.submit(tool_call).result)
+                else:
+                    # 本步第一个工具调用：取结果时直接在请求线程中执行
+                    results.append(tool_call)
+            yield item
+    
+    def _run_tool(self, tool, agent_action, color, run_manager):
+        """在工作线程中执行单个工具（参数与 AgentExecutor 内部调用保持一致）"""
+        tool_run_kwargs = self.agent.tool_run_logging_kwargs()
+        if tool.return_direct:
+            tool_run_kwargs["llm_prefix"] = ""
+        
+        return tool.run(
+            agent_action.tool_input,
+            verbose=self.verbose,
+            color=color,
+            callbacks=run_manager.get_child() if run_manager else None,
+            **tool_run_kwargs,
+        )
+
+
+# 创建 Agent
+def create_agent():
+    """创建 LangChain Agent"""
+    llm = init_llm()
     
     # 创建 Agent
-    agent = create_openai_tools_agent(llm, tools, prompt)
+    agent = create_openai_tools_agent(llm, AGENT_TOOLS, AGENT_PROMPT)
     # ⚠️ 关键修改：设置 return_intermediate_steps=True
-    agent_executor = AgentExecutor(
+    agent_executor = ParallelAgentExecutor(
         agent=agent, 
-        tools=tools, 
-        verbose=True,
+        tools=AGENT_TOOLS, 
+        verbose=logger.isEnabledFor(logging.DEBUG),  # 执行链和工具输出只在 DEBUG 时打印到 stdout
         return_intermediate_steps=True  # 必须开启才能获取工具返回值！
     )
     
     return agent_executor
 
 
+# Agent 实例（进程内复用，首次请求时创建）
+_agent_executor = None
+_agent_lock = threading.Lock()
+
+
+def get_agent_executor():
+    """获取复用的 AgentExecutor（线程安全的懒加载单例）"""
+    global _agent_executor
+    
+    if _agent_executor is None:
+        with _agent_lock:
+            if _agent_executor is None:
+                _agent_executor = create_agent()
+    
+    return _agent_executor
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def extract_json_objects(text):
+    """
+    从文本中按顺序提取所有 JSON 对象（支持嵌套）
+    
+    从每个 "{" 处尝试 raw_decode，成功则直接跳到该对象末尾继续查找。
+    """
+    objects = []
+    idx = text.find('{')
+    
+    while idx != -1:
+        try:
+            obj, end = _JSON_DECODER.raw_decode(text, idx)
+        except ValueError:
+            idx = text.find('{', idx + 1)
+            continue
+        
+        if isinstance(obj, dict):
+            objects.append(obj)
+        idx = text.find('{', end)
+    
+    return objects
+
+
+# 工具名称 → 聊天接口返回中对应的字段（data: 日程, image: 图片, weather: 天气）
+TOOL_RESULT_KEYS = {
+    'get_company_schedule': 'data',
+    'generate_image': 'image',
+    'query_weather': 'weather',
+    'query_weather_full': 'weather',
+}
+
+
+# 关键词路由：整句匹配意图明确的简单请求，直接调用对应功能，省去一次 LLM 往返；
+# 匹配不上或调用失败时返回 None，交给 Agent 处理
+_ROUTE_PREFIX = r'^(?:请问|请)?(?:帮我)?(?:查询|查一下|查看|看看|看一下)?'
+_ROUTE_SUFFIX = r'[。.!！?？]?$'
+
+_SCHEDULE_ROUTE = re.compile(
+    _ROUTE_PREFIX
+    + r'(?P<department>技术部|市场部|人事部|财务部|全体)?(?:员工)?的?(?:员工日程|日程|工作安排)表?'
+    + _ROUTE_SUFFIX
+)
+
+# 城市名中不能出现的内容：时间词（预报类请求交给 Agent）、连接词（多城市）以及闲聊/疑问用语
+_NOT_CITY = r'(?!今天|明天|后天|现在|未来|最近|本周|这周|下周|什么|怎么|聊聊|[和与及跟、你我他她是吗呢哪谁])'
+
+_WEATHER_ROUTE = re.compile(
+    _ROUTE_PREFIX
+    + r'(?P<city>(?:' + _NOT_CITY + r'[\u4e00-\u9fa5]){2,8}?)市?'
+    + r'(?:今天|现在|当前|目前)?的?(?:实时)?(?:天气|气温)(?:怎么样|如何|情况)?'
+    + _ROUTE_SUFFIX
+)
+
+
+def _route_schedule(match):
+    """日程查询：直接调用本地日程数据"""
+    department = match.group('department') or "全体"
+    schedule_data = generate_schedule_data(department)
+    
+    return {
+        "message": f"已为您查询到{department}员工的日程，共 {schedule_data['total_count']} 条安排，详见下方表格。",
+        "data": schedule_data
+    }
+
+
+def _route_weather(match):
+    """实时天气查询：直接调用 MCP 天气服务"""
+    city = match.group('city')
+    weather_data = get_mcp_client("http://localhost:8001").query_current_weather(city)
+    if not weather_data.get('success'):
+        return None
+    
+    return {
+        "message": (
+            f"{weather_data.get('city')}当前天气{weather_data.get('weather')}，"
+            f"气温 {weather_data.get('temperature')}°C，"
+            f"{weather_data.get('winddirection')}风 {weather_data.get('windpower')} 级，"
+            f"湿度 {weather_data.get('humidity')}%（更新时间：{weather_data.get('reporttime')}）。"
+        ),
+        "weather": weather_data
+    }
+
+
+_ROUTES = [
+    (_SCHEDULE_ROUTE, _route_schedule),
+    (_WEATHER_ROUTE, _route_weather),
+]
+
+
+def route_message(user_message):
+    """
+    尝试用关键词路由直接处理消息
+    
+    返回:
+        与聊天接口相同结构的响应字典；未命中或处理失败时返回 None
+    """
+    text = user_message.strip()
+    
+    for pattern, handler in _ROUTES:
+        match = pattern.match(text)
+        if not match:
+            continue
+        
+        try:
+            routed = handler(match)
+        except Exception as e:
+            logger.warning("⚠️ 关键词路由处理失败，交给 Agent: %s", e)
+            return None
+        
+        if routed is None:
+            return None
+        
+        logger.debug("⚡ 关键词路由命中: %s", handler.__name__)
+        return {"success": True, "message": "", "data": None, "image": None, "weather": None, **routed}
+    
+    return None
+
+
 # 聊天接口
 @app.route('/api/chat', methods=['POST'])
 def chat():
@@ -416,114 +795,69 @@ def chat():
         if not user_message:
             return jsonify({"error": "消息不能为空"}), 400
         
-        # 创建 Agent 并执行
-        agent_executor = create_agent()
-        result = agent_executor.invoke({"input": user_message})
+        # 意图明确的简单请求直接处理，不经过 LLM
+        routed = route_message(user_message)
+        if routed is not None:
+            return jsonify(routed)
         
-        print(f"\n{'='*60}")
-        print(f"📥 Agent 执行结果:")
-        print(f"{'='*60}")
+        # 获取 Agent 并执行（对话上下文通过 input 传入，executor 本身无状态）
+        agent_executor = get_agent_executor()
+        result = agent_executor.invoke({"input": user_message})
         
         # 提取结果
         response_text = result.get('output', '')
-        print(f"📝 AI回复: {response_text[:100]}...")
+        logger.debug("📥 Agent 执行完成，AI回复: %.100s...", response_text)
         
-        # 尝试从响应中提取 JSON 数据（日程、图片或天气）
-        schedule_data = None
-        image_data = None
-        weather_data = None
+        # 尝试从响应中提取 JSON 数据（日程、图片或天气），键与返回字段一致
+        tool_data = {"data": None, "image": None, "weather": None}
         
         # 方法1：从中间步骤中提取工具返回值
         intermediate_steps = result.get('intermediate_steps', [])
-        print(f"🔍 中间步骤数量: {len(intermediate_steps)}")
+        logger.debug("🔍 中间步骤数量: %d", len(intermediate_steps))
         
         for i, step in enumerate(intermediate_steps):
-            print(f"\n--- 步骤 {i+1} ---")
-            if len(step) >= 2:
-                action, observation = step
-                
-                # 获取工具名称
-                tool_name = getattr(action, 'tool', 'unknown')
-                print(f"🛠️  工具名称: {tool_name}")
-                print(f"📊 返回数据长度: {len(str(observation))}")
-                
-                # 检查是否调用了画图工具
-                if tool_name == 'generate_image':
-                    print(f"🎨 检测到画图工具调用")
-                    try:
-                        image_data = json.loads(observation)
-                        print(f"✅ 成功提取图片数据!")
-                        print(f"   - image_id: {image_data.get('image_id', 'N/A')}")
-                        print(f"   - url: {image_data.get('url', 'N/A')}")
-                        print(f"   - success: {image_data.get('success', False)}")
-                    except Exception as e:
-                        print(f"❌ 解析图片数据失败: {e}")
-                        print(f"   原始数据: {observation[:200]}")
-                
-                # 检查是否调用了日程工具
-                elif tool_name == 'get_company_schedule':
-                    print(f"📋 检测到日程工具调用")
-                    try:
-                        schedule_data = json.loads(observation)
-                        print(f"✅ 成功提取日程数据!")
-                    except Exception as e:
-                        print(f"❌ 解析日程数据失败: {e}")
-                
-                # 检查是否调用了天气工具
-                elif tool_name == 'query_weather':
-                    print(f"🌤️  检测到天气工具调用（MCP 协议）")
-                    try:
-                        weather_data = json.loads(observation)
-                        print(f"✅ 成功提取天气数据!")
-                        if weather_data.get('success'):
-                            print(f"   - 城市: {weather_data.get('city')}")
-                            print(f"   - 天气: {weather_data.get('weather')}")
-                            print(f"   - 温度: {weather_data.get('temperature')}°C")
-                    except Exception as e:
-                        print(f"❌ 解析天气数据失败: {e}")
-        
-        # 方法2：从响应文本中提取 JSON（备用）
-        if not image_data and not schedule_data and '{' in response_text:
-            print(f"\n🔄 尝试从响应文本中提取JSON...")
+            if len(step) < 2:
+                continue
+            action, observation = step
+            
+            # 获取工具名称，查表得到对应的返回字段
+            tool_name = getattr(action, 'tool', 'unknown')
+            logger.debug("🛠️  步骤 %d 工具名称: %s，返回数据长度: %d", i + 1, tool_name, len(observation))
+            
+            result_key = TOOL_RESULT_KEYS.get(tool_name)
+            if result_key is None:
+                continue
+            
             try:
-                import re
-                json_matches = list(re.finditer(r'\{[^{}]*\}', response_text))
-                print(f"   找到 {len(json_matches)} 个可能的JSON对象")
-                
-                for json_match in json_matches:
-                    try:
-                        parsed_data = json.loads(json_match.group())
-                        
-                        # 检查是否为日程数据
-                        if 'schedules' in parsed_data and not schedule_data:
-                            schedule_data = parsed_data
-                            print(f"✅ 从文本提取到日程数据")
-                        # 检查是否为图片数据
-                        elif ('image_id' in parsed_data or 'url' in parsed_data) and not image_data:
-                            image_data = parsed_data
-                            print(f"✅ 从文本提取到图片数据")
-                    except:
-                        continue
-            except Exception as e:
-                print(f"⚠️  文本提取失败: {e}")
-        
-        print(f"\n{'='*60}")
-        print(f"📤 最终返回:")
-        print(f"   - 日程数据: {'✅ 有' if schedule_data else '❌ 无'}")
-        print(f"   - 图片数据: {'✅ 有' if image_data else '❌ 无'}")
-        print(f"   - 天气数据: {'✅ 有' if weather_data else '❌ 无'}")
-        if image_data:
-            print(f"   - 图片URL: {image_data.get('url', 'N/A')}")
-        if weather_data and weather_data.get('success'):
-            print(f"   - 天气: {weather_data.get('city')} {weather_data.get('weather')} {weather_data.get('temperature')}°C")
-        print(f"{'='*60}\n")
+                tool_data[result_key] = orjson.loads(observation)
+                logger.debug("✅ 成功提取 %s 返回数据: %.200s", tool_name, observation)
+            except orjson.JSONDecodeError as e:
+                logger.warning("❌ 解析 %s 返回数据失败: %s，原始数据: %.200s", tool_name, e, observation)
+        
+        # 方法2：没有调用任何工具时，从响应文本中提取 JSON（备用）
+        if not intermediate_steps and '{' in response_text:
+            json_objects = extract_json_objects(response_text)
+            logger.debug("🔄 从响应文本中找到 %d 个JSON对象", len(json_objects))
+            
+            for parsed_data in json_objects:
+                # 检查是否为日程数据
+                if 'schedules' in parsed_data and not tool_data["data"]:
+                    tool_data["data"] = parsed_data
+                    logger.debug("✅ 从文本提取到日程数据")
+                # 检查是否为图片数据
+                elif ('image_id' in parsed_data or 'url' in parsed_data) and not tool_data["image"]:
+                    tool_data["image"] = parsed_data
+                    logger.debug("✅ 从文本提取到图片数据")
+        
+        logger.debug(
+            "📤 最终返回: 日程数据=%s, 图片数据=%s, 天气数据=%s",
+            tool_data["data"] is not None, tool_data["image"] is not None, tool_data["weather"] is not None
+        )
         
         return jsonify({
             "success": True,
             "message": response_text,
-            "data": schedule_data,
-            "image": image_data,
-            "weather": weather_data
+            **tool_data
         })
         
     except Exception as e:
@@ -547,23 +881,29 @@ def download_excel():
         if not schedules:
             return jsonify({"error": "没有可下载的数据"}), 400
         
-        # 创建 Excel 工作簿
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "员工日程表"
+        # 创建 Excel 工作簿（只写模式，逐行流式写出，不保留单元格对象）
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet("员工日程表")
         
-        # 设置表头
-        headers = ["部门", "员工姓名", "职位", "日期", "任务", "状态", "优先级"]
-        ws.append(headers)
+        # 调整列宽（只写模式下需在写入数据前设置）
+        column_widths = [15, 15, 18, 15, 30, 12, 12]
+        for i, width in enumerate(column_widths, 1):
+            ws.column_dimensions[get_column_letter(i)].width = width
         
-        # 设置表头样式
+        # 设置表头及样式
+        headers = ["部门", "员工姓名", "职位", "日期", "任务", "状态", "优先级"]
         header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
         header_font = Font(color="FFFFFF", bold=True)
+        header_alignment = Alignment(horizontal="center", vertical="center")
         
-        for cell in ws[1]:
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
             cell.fill = header_fill
             cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center")
+            cell.alignment = header_alignment
+            header_cells.append(cell)
+        ws.append(header_cells)
         
         # 添加数据
         for schedule in schedules:
@@ -577,11 +917,6 @@ def download_excel():
                 schedule.get("priority", "")
             ])
         
-        # 调整列宽
-        column_widths = [15, 15, 18, 15, 30, 12, 12]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[openpyxl.utils.get_column_letter(i)].width = width
-        
         # 保存到内存
         excel_file = io.BytesIO()
         wb.save(excel_file)
@@ -608,198 +943,51 @@ def serve_image(filename):
     访问生成的图片
     """
     try:
-        if IMAGE_CONFIG:
-            return send_from_directory(IMAGES_DIR, filename)
-        else:
+        if not IMAGE_CONFIG:
             return jsonify({"error": "图片服务未配置"}), 404
+        
+        if USE_XACCEL:
+            # 只返回响应头，由 nginx 从磁盘直接发送文件
+            if secure_filename(filename) != filename:
+                return jsonify({"error": "非法的文件名"}), 404
+            response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = f"{XACCEL_IMAGES_PREFIX}{filename}"
+        else:
+            response = send_from_directory(
+                IMAGES_DIR,
+                filename,
+                conditional=True,
+                max_age=IMAGE_CACHE_MAX_AGE
+            )
+        
+        response.cache_control.public = True
+        response.cache_control.max_age = IMAGE_CACHE_MAX_AGE
+        response.cache_control.immutable = True
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 404
 
 
+# 健康检查响应体（内容固定，启动时序列化一次）
+_HEALTH_BODY = orjson.dumps({
+    "status": "ok",
+    "message": "服务运行正常"
+})
+
+
 # 健康检查接口
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
-    return jsonify({
-        "status": "ok",
-        "message": "服务运行正常"
-    })
+    # 每次新建 Response：CORS 等 after_request 钩子会修改响应头，不能共享同一对象
+    return Response(_HEALTH_BODY, mimetype='application/json')
 
 
 # 根路径欢迎页面
 @app.route('/', methods=['GET'])
 def index():
     """欢迎页面 - 显示使用说明"""
-    html = """
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>公司员工日程管理 API</title>
-        <style>
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }
-            body {
-                font-family: 'Microsoft YaHei', Arial, sans-serif;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                min-height: 100vh;
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                padding: 20px;
-            }
-            .container {
-                background: white;
-                border-radius: 20px;
-                padding: 40px;
-                max-width: 800px;
-                box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3);
-            }
-            h1 {
-                color: #667eea;
-                margin-bottom: 20px;
-                font-size: 32px;
-            }
-            .status {
-                background: #dcfce7;
-                color: #16a34a;
-                padding: 15px;
-                border-radius: 10px;
-                margin-bottom: 30px;
-                font-weight: 600;
-            }
-            .section {
-                margin-bottom: 30px;
-            }
-            h2 {
-                color: #333;
-                margin-bottom: 15px;
-                font-size: 20px;
-                border-left: 4px solid #667eea;
-                padding-left: 10px;
-            }
-            .instruction {
-                background: #f8f9fa;
-                padding: 20px;
-                border-radius: 10px;
-                margin-bottom: 15px;
-            }
-            .instruction h3 {
-                color: #667eea;
-                margin-bottom: 10px;
-                font-size: 16px;
-            }
-            .instruction p {
-                color: #666;
-                line-height: 1.6;
-                margin-bottom: 10px;
-            }
-            .code {
-                background: #2d2d2d;
-                color: #f8f8f2;
-                padding: 15px;
-                border-radius: 8px;
-                font-family: 'Consolas', monospace;
-                margin: 10px 0;
-                overflow-x: auto;
-            }
-            .button {
-                display: inline-block;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                color: white;
-                padding: 12px 30px;
-                border-radius: 25px;
-                text-decoration: none;
-                font-weight: 600;
-                margin-top: 10px;
-                transition: transform 0.3s ease;
-            }
-            .button:hover {
-                transform: translateY(-2px);
-            }
-            .api-list {
-                list-style: none;
-            }
-            .api-list li {
-                background: #f8f9fa;
-                padding: 10px 15px;
-                margin-bottom: 8px;
-                border-radius: 8px;
-                border-left: 3px solid #667eea;
-            }
-            .api-list code {
-                color: #667eea;
-                font-weight: 600;
-            }
-            .warning {
-                background: #fef3c7;
-                color: #d97706;
-                padding: 15px;
-                border-radius: 10px;
-                margin-top: 20px;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>🤖 公司员工日程管理 API</h1>
-            
-            <div class="status">
-                ✅ 后端服务运行正常！
-            </div>
-            
-            <div class="section">
-                <h2>📖 如何使用聊天机器人？</h2>
-                
-                <div class="instruction">
-                    <h3>方式 1：直接打开前端页面（推荐）</h3>
-                    <p>1. 在项目文件夹中找到 <strong>index.html</strong> 文件</p>
-                    <p>2. <strong>双击打开</strong>或右键选择"用浏览器打开"</p>
-                    <p>3. 开始与 AI 助手对话！</p>
-                </div>
-                
-                <div class="instruction">
-                    <h3>方式 2：使用文件路径</h3>
-                    <p>在浏览器地址栏输入：</p>
-                    <div class="code">file:///你的路径/cursor-web-project/index.html</div>
-                </div>
-                
-                <div class="instruction">
-                    <h3>方式 3：使用 VSCode Live Server</h3>
-                    <p>在 VSCode 中右键 index.html → Open with Live Server</p>
-                </div>
-            </div>
-            
-            <div class="section">
-                <h2>🔌 可用的 API 接口</h2>
-                <ul class="api-list">
-                    <li><code>GET /api/health</code> - 健康检查</li>
-                    <li><code>POST /api/employee-schedule</code> - 获取员工日程</li>
-                    <li><code>POST /api/chat</code> - AI 聊天接口</li>
-                    <li><code>POST /api/download-excel</code> - 下载 Excel</li>
-                </ul>
-            </div>
-            
-            <div class="section">
-                <h2>🏢 支持的部门</h2>
-                <p style="color: #666; line-height: 1.8;">
-                    技术部 • 市场部 • 人事部 • 财务部
-                </p>
-            </div>
-            
-            <div class="warning">
-                ⚠️ <strong>注意：</strong>这是后端 API 服务地址，不是聊天页面。<br>
-                请打开 <strong>index.html</strong> 文件来使用聊天机器人。
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    return html
+    return send_from_directory(app.static_folder, 'index.html', max_age=3600, conditional=True)
 
 
 if __name__ == '__main__':
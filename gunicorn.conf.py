@@ -0,0 +1,20 @@
+"""
+Gunicorn 配置 - 生产环境启动主应用
+
+启动命令: gunicorn -c gunicorn.conf.py app:app
+
+主应用的耗时集中在 DeepSeek、千问画图和 MCP 等外部 HTTP 调用上，
+属于 I/O 密集型，使用 gthread 多线程 worker 即可并发处理请求。
+"""
+import os
+
+# 监听地址
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# worker 进程数与每个进程的线程数
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+# 画图任务最长轮询约 60 秒，再加上 LLM 调用，超时时间需留足余量
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
@@ -2,13 +2,37 @@
 MCP 客户端 - 用于远程调用 FastMCP 天气服务
 通过 SSE (Server-Sent Events) 协议连接到远程 MCP 服务器
 """
-import json
-import requests
-import uuid
+import asyncio
+import logging
+import re
+import httpx
+import orjson
+import itertools
 import threading
-import time
-from typing import Optional, Dict, Any
-from queue import Queue
+from typing import Optional, Dict, Any, Union
+
+logger = logging.getLogger(__name__)
+
+# 发送 MCP 消息的 HTTP 请求超时（秒），SSE 长连接不设超时
+MCP_REQUEST_TIMEOUT = 5
+
+# JSON-RPC 请求 id：1 固定给 initialize，工具调用从 2 开始递增
+_INIT_REQUEST_ID = 1
+
+# JSON-RPC 响应开头的 id（FastMCP 序列化顺序固定为 jsonrpc、id），只在前 128 字节内匹配
+_RESPONSE_ID = re.compile(rb'\{\s*"jsonrpc"\s*:\s*"2\.0"\s*,\s*"id"\s*:\s*(\d+)')
+_RESPONSE_ID_WINDOW = 128
+
+# SSE 帧之间以空行分隔，兼容 \r\n、\n、\r 三种换行
+_SSE_FRAME_END = re.compile(rb'\r\n\r\n|\n\n|\r\r')
+
+# SSE 行前缀（直接在原始字节上匹配）和事件名
+_EV = b'event: '
+_DAT = b'data: '
+_EV_LEN = len(_EV)
+_DAT_LEN = len(_DAT)
+_EVENT_ENDPOINT = b'endpoint'
+_EVENT_MESSAGE = b'message'
 
 
 class MCPWeatherClient:
@@ -18,87 +42,162 @@ class MCPWeatherClient:
         """
         初始化 MCP 客户端
         
+        SSE 读取和所有 HTTP 请求都运行在客户端专用的事件循环线程中，
+        对外的同步方法通过 run_coroutine_threadsafe 提交协程并等待结果。
+        SSE 握手和 MCP 初始化推迟到第一次调用工具时进行。
+        
         Args:
             server_url: MCP 服务器地址（SSE模式）
         """
         self.server_url = server_url.rstrip('/')
-        self.session = requests.Session()
-        self.response_queue = Queue()
         self.message_endpoint = None  # 服务器分配的消息端点
-        self.sse_thread = None
-        self._start_sse_connection()
-        print(f"🔗 [MCP客户端] 初始化会话完成")
+        self._endpoint_ready = threading.Event()
+        # 连接和 MCP 初始化完成后置位；并发的首次调用由锁保证只握手一次
+        self._ready = threading.Event()
+        self._connect_lock = threading.Lock()
+        # 等待响应的请求: request_id -> Future（只在事件循环线程中访问，无需加锁）
+        self._pending: Dict[Any, asyncio.Future] = {}
+        self._next_id = itertools.count(_INIT_REQUEST_ID + 1)
+        
+        # 启动专用事件循环线程
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="mcp-client-loop",
+            daemon=True
+        )
+        self._loop_thread.start()
+        
+        # 消息请求固定发往同一服务器、使用相同请求头，预先配置到客户端上
+        self._http = httpx.AsyncClient(
+            base_url=self.server_url,
+            headers={"Content-Type": "application/json"},
+            timeout=MCP_REQUEST_TIMEOUT
+        )
+        self._sse_task = None
+    
+    def _run(self, coro):
+        """在客户端事件循环中执行协程，并在当前线程同步等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+    
+    def _ensure_connected(self) -> bool:
+        """
+        确保 SSE 连接已建立并完成 MCP 初始化（首次调用工具时执行）
+        
+        Returns:
+            连接是否可用；失败时不置位，下次调用会重新尝试
+        """
+        if self._ready.is_set():
+            return True
+        
+        with self._connect_lock:
+            if not self._ready.is_set():
+                # SSE 读取任务未启动或已退出时重新建立连接
+                if self._sse_task is None or self._sse_task.done():
+                    self._start_sse_connection()
+                
+                # 发送 MCP 初始化请求
+                if self.message_endpoint is not None and self._run(self._initialize_mcp()):
+                    self._ready.set()
+                    logger.debug("🔗 [MCP客户端] 初始化会话完成")
+        
+        return self._ready.is_set()
     
     def _start_sse_connection(self):
         """启动 SSE 长连接"""
-        def sse_listener():
-            try:
-                endpoint = f"{self.server_url}/sse"
-                response = self.session.get(
-                    endpoint,
-                    headers={
-                        "Accept": "text/event-stream",
-                        "Cache-Control": "no-cache"
-                    },
-                    stream=True,
-                    timeout=None
-                )
-                
-                # 读取 SSE 流
-                current_event = None
-                for line in response.iter_lines():
-                    if line:
-                        line_str = line.decode('utf-8')
-                        
-                        # 解析 SSE 事件类型
-                        if line_str.startswith('event: '):
-                            current_event = line_str[7:].strip()
-                        elif line_str.startswith('data: '):
-                            data_str = line_str[6:]
-                            
-                            # 如果是 endpoint 事件，保存消息端点
-                            if current_event == 'endpoint':
-                                self.message_endpoint = data_str
-                                print(f"📍 [MCP客户端] 收到服务器端点: {self.message_endpoint}")
-                            # 如果是 message 事件，解析 JSON 并放入队列
-                            elif current_event == 'message':
-                                try:
-                                    data = json.loads(data_str)
-                                    self.response_queue.put(data)
-                                except:
-                                    pass
-                            
-                            current_event = None
-                                
-            except Exception as e:
-                print(f"⚠️ [MCP客户端] SSE 连接错误: {e}")
+        self.message_endpoint = None
+        self._endpoint_ready.clear()
         
-        # 启动后台线程监听 SSE
-        self.sse_thread = threading.Thread(target=sse_listener, daemon=True)
-        self.sse_thread.start()
+        # 在事件循环中启动 SSE 读取任务
+        self._sse_task = asyncio.run_coroutine_threadsafe(self._sse_reader(), self._loop)
         
         # 等待服务器发送 endpoint
-        timeout = 5
-        start_time = time.time()
-        while self.message_endpoint is None and time.time() - start_time < timeout:
-            time.sleep(0.1)
+        self._endpoint_ready.wait(timeout=5)
         
         if self.message_endpoint is None:
-            print(f"⚠️ [MCP客户端] 未收到服务器端点")
+            logger.warning("⚠️ [MCP客户端] 未收到服务器端点")
         else:
-            print(f"✅ [MCP客户端] SSE 连接建立成功")
-            # 发送 MCP 初始化请求
-            self._initialize_mcp()
+            logger.debug("✅ [MCP客户端] SSE 连接建立成功")
     
-    def _initialize_mcp(self):
-        """发送 MCP 初始化请求"""
+    async def _sse_reader(self):
+        """读取 SSE 流，保存消息端点并分发响应"""
+        try:
+            async with self._http.stream(
+                "GET",
+                "/sse",
+                headers={
+                    "Accept": "text/event-stream",
+                    "Cache-Control": "no-cache"
+                },
+                timeout=None
+            ) as response:
+                
+                # 按收到的原始字节读取 SSE 流（不指定块大小，避免攒满缓冲才返回），遇到空行切出完整帧后再解析
+                buf = bytearray()
+                async for chunk in response.aiter_bytes():
+                    buf.extend(chunk)
+                    while (match := _SSE_FRAME_END.search(buf)) is not None:
+                        frame = bytes(buf[:match.start()])
+                        del buf[:match.end()]
+                        self._dispatch_frame(frame)
+                        
+        except Exception as e:
+            logger.warning("⚠️ [MCP客户端] SSE 连接错误: %s", e)
+        finally:
+            # 连接断开后会话失效，下次调用工具时重新握手
+            self._ready.clear()
+            # 唤醒仍在等待端点的握手，并让等待响应的请求立即失败，不必等到超时
+            self._endpoint_ready.set()
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("MCP SSE 连接已断开"))
+    
+    def _dispatch_frame(self, frame: bytes):
+        """解析单个 SSE 帧，只在需要时解码 data 内容"""
+        current_event = None
+        data = None
+        for line in frame.splitlines():
+            if line.startswith(_EV):
+                current_event = line[_EV_LEN:].strip()
+            elif line.startswith(_DAT):
+                data = line[_DAT_LEN:]
+        
+        if data is None:
+            return
+        
+        # 如果是 endpoint 事件，保存消息端点
+        if current_event == _EVENT_ENDPOINT:
+            self.message_endpoint = data.decode('utf-8')
+            self._endpoint_ready.set()
+            logger.debug("📍 [MCP客户端] 收到服务器端点: %s", self.message_endpoint)
+        # 如果是 message 事件，只取出 id，把原始字节交给等待该 id 的调用方自行解析
+        elif current_event == _EVENT_MESSAGE:
+            future = self._pending.pop(self._extract_response_id(data), None)
+            if future is not None and not future.done():
+                future.set_result(data)
+    
+    @staticmethod
+    def _extract_response_id(data: bytes):
+        """从响应开头快速匹配整数 id，匹配不到时才完整解析 JSON"""
+        match = _RESPONSE_ID.match(data, 0, _RESPONSE_ID_WINDOW)
+        if match is not None:
+            return int(match.group(1))
+        
+        try:
+            message = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return None
+        return message.get("id") if isinstance(message, dict) else None
+    
+    async def _initialize_mcp(self) -> bool:
+        """发送 MCP 初始化请求，成功返回 True"""
+        future = self._register_pending(_INIT_REQUEST_ID)
         try:
-            endpoint = f"{self.server_url}{self.message_endpoint}"
-            
             # 构造 MCP 初始化请求
             init_request = {
                 "jsonrpc": "2.0",
-                "id": 1,
+                "id": _INIT_REQUEST_ID,
                 "method": "initialize",
                 "params": {
                     "protocolVersion": "2024-11-05",
@@ -115,48 +214,59 @@ class MCPWeatherClient:
             }
             
             # 发送初始化请求
-            response = self.session.post(
-                endpoint,
-                json=init_request,
-                headers={"Content-Type": "application/json"},
-                timeout=5
+            response = await self._http.post(
+                self.message_endpoint,
+                content=orjson.dumps(init_request)
             )
             
             if response.status_code in [200, 202]:
                 # 等待初始化响应
-                timeout = 5
-                start_time = time.time()
-                while time.time() - start_time < timeout:
-                    if not self.response_queue.empty():
-                        init_response = self.response_queue.get()
-                        if init_response.get("id") == 1:
-                            print(f"✅ [MCP客户端] MCP 协议初始化完成")
-                            
-                            # 发送 initialized 通知
-                            initialized_notification = {
-                                "jsonrpc": "2.0",
-                                "method": "notifications/initialized"
-                            }
-                            self.session.post(
-                                endpoint,
-                                json=initialized_notification,
-                                headers={"Content-Type": "application/json"},
-                                timeout=5
-                            )
-                            return
-                    time.sleep(0.1)
+                init_response = await self._wait_response(future, timeout=5)
+                if init_response is not None:
+                    logger.debug("✅ [MCP客户端] MCP 协议初始化完成")
+                    
+                    # 发送 initialized 通知
+                    initialized_notification = {
+                        "jsonrpc": "2.0",
+                        "method": "notifications/initialized"
+                    }
+                    await self._http.post(
+                        self.message_endpoint,
+                        content=orjson.dumps(initialized_notification)
+                    )
+                    return True
                 
-                print(f"⚠️ [MCP客户端] 初始化响应超时")
+                logger.warning("⚠️ [MCP客户端] 初始化响应超时")
             else:
-                print(f"⚠️ [MCP客户端] 初始化请求失败: {response.status_code}")
+                logger.warning("⚠️ [MCP客户端] 初始化请求失败: %s", response.status_code)
                 
         except Exception as e:
-            print(f"⚠️ [MCP客户端] 初始化错误: {e}")
+            logger.warning("⚠️ [MCP客户端] 初始化错误: %s", e)
+        finally:
+            self._pending.pop(_INIT_REQUEST_ID, None)
+        
+        return False
+    
+    def _register_pending(self, request_id) -> asyncio.Future:
+        """在发送请求前登记 Future，SSE 读取任务收到对应 id 的响应后设置结果"""
+        future = self._loop.create_future()
+        self._pending[request_id] = future
+        return future
+    
+    async def _wait_response(self, future: asyncio.Future, timeout: float) -> Optional[bytes]:
+        """等待指定请求的响应（未解析的原始字节），超时返回 None"""
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
         
     def _call_tool(self, tool_name: str, arguments: dict) -> dict:
         """
         调用 MCP 工具（通过 SSE 消息端点）
         
+        请求在事件循环中发送和等待，响应 JSON 在调用方线程中解析，
+        不占用 SSE 读取所在的事件循环。
+        
         Args:
             tool_name: 工具名称
             arguments: 工具参数
@@ -164,20 +274,71 @@ class MCPWeatherClient:
         Returns:
             工具执行结果
         """
+        if not self._ensure_connected():
+            return {
+                "success": False,
+                "error": "MCP 连接未建立"
+            }
+        
+        response = self._run(self._send_tool_call(tool_name, arguments))
+        if isinstance(response, dict):
+            # 发送或等待阶段已失败，直接返回错误信息
+            return response
+        
         try:
-            # 检查是否已获取到消息端点
-            if self.message_endpoint is None:
+            mcp_response = orjson.loads(response)
+            
+            # 检查是否有错误
+            if "error" in mcp_response:
                 return {
                     "success": False,
-                    "error": "MCP 连接未建立"
+                    "error": mcp_response["error"].get("message", "未知错误")
                 }
             
-            # 使用服务器分配的消息端点（包含 session_id）
-            # message_endpoint 已经是完整路径（带前导斜杠），直接拼接
-            endpoint = f"{self.server_url}{self.message_endpoint}"
+            # 提取工具返回的结果
+            result = mcp_response.get("result", {})
+            
+            # 优先使用结构化结果，随整个响应一起解析完成，无需再解析一次 JSON 文本
+            structured = result.get("structuredContent")
+            if structured is not None:
+                return structured
+            
+            # 兼容只返回文本的服务端：工具结果以 JSON 文本放在 content 字段中
+            if "content" in result and len(result["content"]) > 0:
+                content_item = result["content"][0]
+                if content_item.get("type") == "text":
+                    # 解析 JSON 文本
+                    return orjson.loads(content_item.get("text", "{}"))
             
+            return {
+                "success": False,
+                "error": "无法解析MCP响应"
+            }
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"MCP调用失败: {str(e)}"
+            }
+    
+    async def _send_tool_call(self, tool_name: str, arguments: dict) -> Union[bytes, dict]:
+        """
+        发送 tools/call 请求并等待 SSE 返回对应响应
+        
+        Returns:
+            响应的原始字节；失败时返回错误信息字典
+        """
+        # 检查是否已获取到消息端点
+        if self.message_endpoint is None:
+            return {
+                "success": False,
+                "error": "MCP 连接未建立"
+            }
+        
+        request_id = next(self._next_id)
+        future = self._register_pending(request_id)
+        try:
             # 构造 MCP 请求消息（JSON-RPC 2.0）
-            request_id = str(uuid.uuid4())
             mcp_request = {
                 "jsonrpc": "2.0",
                 "id": request_id,
@@ -189,13 +350,10 @@ class MCPWeatherClient:
             }
             
             # 发送请求到 MCP 服务器（通过 POST，响应会从 SSE 返回）
-            response = self.session.post(
-                endpoint,
-                json=mcp_request,
-                headers={
-                    "Content-Type": "application/json"
-                },
-                timeout=5
+            # 使用服务器分配的消息端点（包含 session_id），相对客户端的 base_url
+            response = await self._http.post(
+                self.message_endpoint,
+                content=orjson.dumps(mcp_request)
             )
             
             if response.status_code != 200 and response.status_code != 202:
@@ -204,51 +362,21 @@ class MCPWeatherClient:
                     "error": f"MCP服务器返回错误: {response.status_code} - {response.text}"
                 }
             
-            # 从 SSE 队列中等待响应
-            timeout = 30
-            start_time = time.time()
-            
-            while time.time() - start_time < timeout:
-                if not self.response_queue.empty():
-                    mcp_response = self.response_queue.get()
-                    
-                    # 检查是否是对应的响应
-                    if mcp_response.get("id") == request_id:
-                        # 检查是否有错误
-                        if "error" in mcp_response:
-                            return {
-                                "success": False,
-                                "error": mcp_response["error"].get("message", "未知错误")
-                            }
-                        
-                        # 提取工具返回的结果
-                        result = mcp_response.get("result", {})
-                        
-                        # FastMCP 的工具返回结果在 content 字段中
-                        if "content" in result and len(result["content"]) > 0:
-                            content_item = result["content"][0]
-                            if content_item.get("type") == "text":
-                                # 解析 JSON 文本
-                                return json.loads(content_item.get("text", "{}"))
-                        
-                        return {
-                            "success": False,
-                            "error": "无法解析MCP响应"
-                        }
-                
-                time.sleep(0.1)
-            
-            return {
-                "success": False,
-                "error": "等待MCP响应超时"
-            }
+            # 等待 SSE 返回对应的响应
+            raw_response = await self._wait_response(future, timeout=30)
+            if raw_response is None:
+                return {
+                    "success": False,
+                    "error": "等待MCP响应超时"
+                }
+            return raw_response
             
-        except requests.Timeout:
+        except httpx.TimeoutException:
             return {
                 "success": False,
                 "error": "MCP服务器请求超时"
             }
-        except requests.ConnectionError:
+        except (httpx.ConnectError, ConnectionError):
             return {
                 "success": False,
                 "error": f"无法连接到MCP服务器: {self.server_url}"
@@ -258,6 +386,8 @@ class MCPWeatherClient:
                 "success": False,
                 "error": f"MCP调用失败: {str(e)}"
             }
+        finally:
+            self._pending.pop(request_id, None)
     
     def query_current_weather(self, city: str) -> dict:
         """
@@ -269,16 +399,14 @@ class MCPWeatherClient:
         Returns:
             天气数据字典
         """
-        print(f"🔄 [MCP客户端] 调用远程服务: query_current_weather")
-        print(f"   - 服务器: {self.server_url}")
-        print(f"   - 城市: {city}")
+        logger.debug("🔄 [MCP客户端] 调用远程服务: query_current_weather，服务器: %s，城市: %s", self.server_url, city)
         
         result = self._call_tool("query_current_weather", {"city": city})
         
         if result.get("success"):
-            print(f"✅ [MCP客户端] 调用成功!")
+            logger.debug("✅ [MCP客户端] 调用成功!")
         else:
-            print(f"❌ [MCP客户端] 调用失败: {result.get('error')}")
+            logger.warning("❌ [MCP客户端] 调用失败: %s", result.get('error'))
         
         return result
     
@@ -292,27 +420,26 @@ class MCPWeatherClient:
         Returns:
             天气预报数据字典
         """
-        print(f"🔄 [MCP客户端] 调用远程服务: query_weather_forecast")
-        print(f"   - 服务器: {self.server_url}")
-        print(f"   - 城市: {city}")
+        logger.debug("🔄 [MCP客户端] 调用远程服务: query_weather_forecast，服务器: %s，城市: %s", self.server_url, city)
         
         result = self._call_tool("query_weather_forecast", {"city": city})
         
         if result.get("success"):
-            print(f"✅ [MCP客户端] 调用成功! (预报{result.get('days', 0)}天)")
+            logger.debug("✅ [MCP客户端] 调用成功! (预报%s天)", result.get('days', 0))
         else:
-            print(f"❌ [MCP客户端] 调用失败: {result.get('error')}")
+            logger.warning("❌ [MCP客户端] 调用失败: %s", result.get('error'))
         
         return result
 
 
 # 全局客户端实例
 _mcp_client: Optional[MCPWeatherClient] = None
+_mcp_lock = threading.Lock()
 
 
 def get_mcp_client(server_url: str = "http://localhost:8001") -> MCPWeatherClient:
     """
-    获取 MCP 客户端实例（单例模式）
+    获取 MCP 客户端实例（线程安全的懒加载单例）
     
     Args:
         server_url: MCP 服务器地址
@@ -323,14 +450,18 @@ def get_mcp_client(server_url: str = "http://localhost:8001") -> MCPWeatherClien
     global _mcp_client
     
     if _mcp_client is None:
-        _mcp_client = MCPWeatherClient(server_url)
-        print(f"🌐 [MCP客户端] 初始化连接: {server_url}")
+        with _mcp_lock:
+            if _mcp_client is None:
+                _mcp_client = MCPWeatherClient(server_url)
+                logger.debug("🌐 [MCP客户端] 初始化连接: %s", server_url)
     
     return _mcp_client
 
 
 if __name__ == "__main__":
     # 测试代码
+    logging.basicConfig(level=logging.WARNING)
+    
     print("=" * 60)
     print("🧪 MCP 客户端测试")
     print("=" * 60)
@@ -341,13 +472,13 @@ if __name__ == "__main__":
     # 测试实时天气
     print("📍 测试1: 查询北京实时天气")
     result = client.query_current_weather("北京")
-    print(f"结果: {json.dumps(result, ensure_ascii=False, indent=2)}")
+    print(f"结果: {orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()}")
     print()
     
     # 测试天气预报
     print("📍 测试2: 查询上海天气预报")
     result = client.query_weather_forecast("上海")
-    print(f"结果: {json.dumps(result, ensure_ascii=False, indent=2)}")
+    print(f"结果: {orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()}")
     print()
     
     print("=" * 60)
@@ -1,11 +1,75 @@
 import os
-import requests
-from typing import Optional
+import asyncio
+import functools
+import logging
+import httpx
+import orjson
+from cachetools import LRUCache, TTLCache
+from typing import Awaitable, Callable, Dict, Hashable, Optional
 from mcp.server.fastmcp import FastMCP
+from mcp.types import CallToolResult, TextContent
+
+try:
+    import uvloop
+except ImportError:  # Windows 不支持 uvloop，退回标准事件循环
+    uvloop = None
+
+# 请求路径上的日志默认不输出（FastMCP 默认日志级别为 INFO），调试时设置 DEBUG 查看
+logger = logging.getLogger(__name__)
+# httpx/httpcore 在 INFO 级别为每个请求记录完整 URL（包含高德 API Key），只保留警告
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("httpcore").setLevel(logging.WARNING)
 
 # 高德地图 API Key
 AMAP_API_KEY = "xxx"
 
+# 高德地图 API 共享异步客户端：复用 TLS 会话和 HTTP/2 连接，
+# 城市编码查询和天气查询走同一条连接，省去每次调用的握手开销
+AMAP_BASE_URL = "https://restapi.amap.com"
+# 传输层对连接失败自动重试；429/5xx 由 amap_get 按退避间隔重试
+_AMAP = httpx.AsyncClient(
+    base_url=AMAP_BASE_URL,
+    timeout=10.0,
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=3,
+        limits=httpx.Limits(max_keepalive_connections=32)
+    )
+)
+
+# 高德地图 API 临时错误的重试间隔（秒），Retry-After 最多等待 AMAP_MAX_RETRY_AFTER 秒
+AMAP_RETRY_DELAYS = (0.1, 0.4, 1.6)
+AMAP_RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+AMAP_MAX_RETRY_AFTER = 5.0
+
+# 城市编码缓存（城市 → adcode 基本不变，进程内长期缓存；未找到的城市缓存为 None）
+CITY_CODE_CACHE_SIZE = 4096
+_CITY_CODE_CACHE = LRUCache(maxsize=CITY_CODE_CACHE_SIZE)
+
+# 常用城市的 adcode（国家行政区划代码，长期不变），命中时省去一次城市编码查询，
+# 冷启动时工具只需请求一次天气接口
+COMMON_CITY_CODES = {
+    "北京": "110000", "天津": "120000", "上海": "310000", "重庆": "500000",
+    "石家庄": "130100", "太原": "140100", "呼和浩特": "150100", "沈阳": "210100",
+    "大连": "210200", "长春": "220100", "哈尔滨": "230100", "南京": "320100",
+    "无锡": "320200", "苏州": "320500", "杭州": "330100", "宁波": "330200",
+    "合肥": "340100", "福州": "350100", "厦门": "350200", "南昌": "360100",
+    "济南": "370100", "青岛": "370200", "郑州": "410100", "武汉": "420100",
+    "长沙": "430100", "广州": "440100", "深圳": "440300", "佛山": "440600",
+    "东莞": "441900", "南宁": "450100", "海口": "460100", "成都": "510100",
+    "贵阳": "520100", "昆明": "530100", "拉萨": "540100", "西安": "610100",
+    "兰州": "620100", "西宁": "630100", "银川": "640100", "乌鲁木齐": "650100",
+}
+
+# 天气结果缓存：高德天气数据约 10 分钟更新一次，按 (城市编码, extensions) 缓存 5 分钟
+WEATHER_CACHE_SIZE = 1024
+WEATHER_CACHE_TTL = 300
+_WEATHER_CACHE = TTLCache(maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_CACHE_TTL)
+
+# 进行中的高德请求：相同 key 的并发冷查询共享同一个请求
+# （缓存和此表只在事件循环线程中访问，无需加锁）
+_INFLIGHT: Dict[Hashable, asyncio.Future] = {}
+
 # 创建 FastMCP 服务器实例（配置 HTTP 端口和主机）
 mcp = FastMCP(
     "天气查询服务-FastMCP",
@@ -15,7 +79,70 @@ mcp = FastMCP(
 )
 
 
-def get_city_code(city_name: str) -> Optional[str]:
+async def _single_flight(key: Hashable, fetch: Callable[[], Awaitable]):
+    """同一 key 同时只发一个请求，其他调用方等待同一结果"""
+    future = _INFLIGHT.get(key)
+    if future is None:
+        future = asyncio.ensure_future(fetch())
+        _INFLIGHT[key] = future
+        future.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+    # shield：某个调用方被取消时不影响其他等待者
+    return await asyncio.shield(future)
+
+
+async def amap_get(path: str, params: dict) -> httpx.Response:
+    """
+    请求高德地图 API，遇到 429/5xx 时按退避间隔重试
+    
+    服务端多等几百毫秒，避免错误返回给 LLM 后整轮重新推理。
+    429 响应带 Retry-After 时按其等待（有上限）。
+    """
+    for delay in AMAP_RETRY_DELAYS:
+        response = await _AMAP.get(path, params=params)
+        if response.status_code not in AMAP_RETRY_STATUS:
+            return response
+        
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            delay = min(float(retry_after), AMAP_MAX_RETRY_AFTER)
+        logger.debug("🔁 高德地图 API 返回 %d，%.1f 秒后重试: %s", response.status_code, delay, path)
+        await asyncio.sleep(delay)
+    
+    return await _AMAP.get(path, params=params)
+
+
+async def _fetch_city_code(city_name: str) -> Optional[str]:
+    """
+    向高德地图查询城市编码并写入缓存
+    
+    未找到的城市返回 None 并同样缓存，避免错别字反复请求；
+    网络错误或 API 错误直接抛出异常，不会进入缓存。
+    """
+    params = {
+        "key": AMAP_API_KEY,
+        "keywords": city_name,
+        "subdistrict": 0
+    }
+    
+    response = await amap_get("/v3/config/district", params=params)
+    result = response.json()
+    
+    if result.get("status") != "1":
+        raise RuntimeError(f"高德地图 API 返回错误: {result.get('info')}")
+    
+    adcode = result["districts"][0]["adcode"] if result.get("districts") else None
+    _CITY_CODE_CACHE[city_name] = adcode
+    return adcode
+
+
+async def _lookup_city_code(city_name: str) -> Optional[str]:
+    """查询城市编码（优先读缓存，并发的冷查询合并为一次请求）"""
+    if city_name in _CITY_CODE_CACHE:
+        return _CITY_CODE_CACHE[city_name]
+    return await _single_flight(("district", city_name), lambda: _fetch_city_code(city_name))
+
+
+async def get_city_code(city_name: str) -> Optional[str]:
     """
     获取城市的 adcode 编码
     
@@ -25,31 +152,76 @@ def get_city_code(city_name: str) -> Optional[str]:
     Returns:
         城市编码，如果未找到返回 None
     """
-    url = "https://restapi.amap.com/v3/config/district"
+    adcode = COMMON_CITY_CODES.get(city_name)
+    if adcode is None:
+        try:
+            adcode = await _lookup_city_code(city_name)
+        except Exception as e:
+            logger.warning("❌ 获取城市编码失败: %s", e)
+            return None
+    
+    if adcode:
+        logger.debug("🗺️  城市编码: %s → %s", city_name, adcode)
+    else:
+        logger.debug("❌ 未找到城市: %s", city_name)
+    return adcode
+
+
+async def _fetch_weather_info(city_code: str, extensions: str) -> dict:
+    """请求高德天气接口，成功结果写入缓存"""
     params = {
         "key": AMAP_API_KEY,
-        "keywords": city_name,
-        "subdistrict": 0
+        "city": city_code,
+        "extensions": extensions
     }
+    result = (await amap_get("/v3/weather/weatherInfo", params=params)).json()
     
-    try:
-        response = requests.get(url, params=params, timeout=10)
-        result = response.json()
-        
-        if result.get("status") == "1" and result.get("districts"):
-            adcode = result["districts"][0]["adcode"]
-            print(f"🗺️  城市编码: {city_name} → {adcode}")
-            return adcode
-        else:
-            print(f"❌ 未找到城市: {city_name}")
-            return None
-    except Exception as e:
-        print(f"❌ 获取城市编码失败: {e}")
-        return None
+    if result.get("status") == "1":
+        _WEATHER_CACHE[(city_code, extensions)] = result
+    return result
+
+
+async def fetch_weather_info(city_code: str, extensions: str) -> dict:
+    """
+    查询高德天气接口（带短期缓存）
+    
+    Args:
+        city_code: 城市编码
+        extensions: base=实时天气，all=预报天气
+    
+    Returns:
+        高德地图 API 返回的原始 JSON，只缓存 status 为 "1" 的结果
+    """
+    cached = _WEATHER_CACHE.get((city_code, extensions))
+    if cached is not None:
+        return cached
+    return await _single_flight(
+        ("weather", city_code, extensions),
+        lambda: _fetch_weather_info(city_code, extensions)
+    )
+
+
+def structured_result(func):
+    """
+    把工具返回的字典作为 structuredContent 直接交给 MCP 传输层
+    
+    客户端直接读取 structuredContent，无需再解析 JSON 文本；
+    content 中保留一份紧凑的 JSON 文本，兼容只读取 content 的客户端。
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        data = await func(*args, **kwargs)
+        return CallToolResult(
+            content=[TextContent(type="text", text=orjson.dumps(data).decode())],
+            structuredContent=data,
+            isError=False
+        )
+    return wrapper
 
 
 @mcp.tool()
-def query_current_weather(city: str) -> dict:
+@structured_result
+async def query_current_weather(city: str) -> dict:
     """
     查询指定城市的实时天气信息
     
@@ -67,13 +239,10 @@ def query_current_weather(city: str) -> dict:
         - humidity: 湿度（%）
         - reporttime: 数据更新时间
     """
-    print(f"\n{'='*60}")
-    print(f"🌤️  [MCP工具调用] query_current_weather")
-    print(f"📍 城市: {city}")
-    print(f"{'='*60}\n")
+    logger.debug("🌤️  [MCP工具调用] query_current_weather，城市: %s", city)
     
     # 获取城市编码
-    city_code = get_city_code(city)
+    city_code = await get_city_code(city)
     if not city_code:
         return {
             "success": False,
@@ -81,16 +250,8 @@ def query_current_weather(city: str) -> dict:
         }
     
     # 查询实时天气
-    weather_url = "https://restapi.amap.com/v3/weather/weatherInfo"
-    params = {
-        "key": AMAP_API_KEY,
-        "city": city_code,
-        "extensions": "base"  # base=实时天气
-    }
-    
     try:
-        response = requests.get(weather_url, params=params, timeout=10)
-        result = response.json()
+        result = await fetch_weather_info(city_code, "base")  # base=实时天气
         
         if result.get("status") != "1":
             return {
@@ -120,16 +281,15 @@ def query_current_weather(city: str) -> dict:
             "reporttime": weather_data.get("reporttime")
         }
         
-        print(f"✅ 查询成功!")
-        print(f"   城市: {result_data['city']}")
-        print(f"   天气: {result_data['weather']}")
-        print(f"   温度: {result_data['temperature']}°C")
-        print(f"   湿度: {result_data['humidity']}%\n")
+        logger.debug(
+            "✅ 查询成功! 城市: %s，天气: %s，温度: %s°C，湿度: %s%%",
+            result_data['city'], result_data['weather'], result_data['temperature'], result_data['humidity']
+        )
         
         return result_data
         
     except Exception as e:
-        print(f"❌ 查询失败: {e}\n")
+        logger.warning("❌ 查询失败: %s", e)
         return {
             "success": False,
             "error": f"查询天气时发生错误: {str(e)}"
@@ -137,7 +297,8 @@ def query_current_weather(city: str) -> dict:
 
 
 @mcp.tool()
-def query_weather_forecast(city: str) -> dict:
+@structured_result
+async def query_weather_forecast(city: str) -> dict:
     """
     查询指定城市的未来天气预报
     
@@ -159,13 +320,10 @@ def query_weather_forecast(city: str) -> dict:
             - daywind: 白天风向
             - nightwind: 夜间风向
     """
-    print(f"\n{'='*60}")
-    print(f"📅 [MCP工具调用] query_weather_forecast")
-    print(f"📍 城市: {city}")
-    print(f"{'='*60}\n")
+    logger.debug("📅 [MCP工具调用] query_weather_forecast，城市: %s", city)
     
     # 获取城市编码
-    city_code = get_city_code(city)
+    city_code = await get_city_code(city)
     if not city_code:
         return {
             "success": False,
@@ -173,16 +331,8 @@ def query_weather_forecast(city: str) -> dict:
         }
     
     # 查询天气预报
-    weather_url = "https://restapi.amap.com/v3/weather/weatherInfo"
-    params = {
-        "key": AMAP_API_KEY,
-        "city": city_code,
-        "extensions": "all"  # all=预报天气
-    }
-    
     try:
-        response = requests.get(weather_url, params=params, timeout=10)
-        result = response.json()
+        result = await fetch_weather_info(city_code, "all")  # all=预报天气
         
         if result.get("status") != "1":
             return {
@@ -222,23 +372,52 @@ def query_weather_forecast(city: str) -> dict:
             "days": len(forecast_list)
         }
         
-        print(f"✅ 查询成功!")
-        print(f"   城市: {result_data['city']}")
-        print(f"   预报天数: {result_data['days']}天")
-        for i, forecast in enumerate(forecast_list, 1):
-            print(f"   第{i}天: {forecast['date']} ({forecast['week']}) {forecast['dayweather']}/{forecast['nightweather']}")
-        print()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("✅ 查询成功! 城市: %s，预报天数: %d天", result_data['city'], result_data['days'])
+            for i, forecast in enumerate(forecast_list, 1):
+                logger.debug(
+                    "   第%d天: %s (%s) %s/%s",
+                    i, forecast['date'], forecast['week'], forecast['dayweather'], forecast['nightweather']
+                )
         
         return result_data
         
     except Exception as e:
-        print(f"❌ 查询失败: {e}\n")
+        logger.warning("❌ 查询失败: %s", e)
         return {
             "success": False,
             "error": f"查询天气预报时发生错误: {str(e)}"
         }
 
 
+async def warm_up_amap():
+    """启动时预先建立到高德地图 API 的连接，避免首个工具调用承担握手耗时"""
+    try:
+        await _AMAP.head("/")
+    except httpx.HTTPError as e:
+        logger.warning("⚠️  高德地图 API 连接预热失败: %s", e)
+
+
+async def serve(transport: str):
+    """在同一个事件循环中预热高德连接并运行 MCP 服务器"""
+    await warm_up_amap()
+    try:
+        if transport == "sse":
+            await mcp.run_sse_async()
+        else:
+            await mcp.run_stdio_async()
+    finally:
+        await _AMAP.aclose()
+
+
+def run_server(transport: str):
+    """启动服务器，可用时使用 uvloop 事件循环"""
+    if uvloop is not None:
+        uvloop.run(serve(transport))
+    else:
+        asyncio.run(serve(transport))
+
+
 if __name__ == "__main__":
     import sys
     
@@ -270,7 +449,7 @@ if __name__ == "__main__":
         print()
         
         # 运行 FastMCP 服务器（SSE 模式，端口和主机在实例化时已配置）
-        mcp.run(transport="sse")
+        run_server("sse")
     else:
         print("🌐 运行模式: STDIO - 用于 MCP Inspector 调试")
         print("   调试命令: npx @modelcontextprotocol/inspector python fastmcp_server.py")
@@ -281,5 +460,5 @@ if __name__ == "__main__":
         print()
         
         # 运行 FastMCP 服务器（stdio 模式，配合 Inspector 使用）
-        mcp.run(transport="stdio")
+        run_server("stdio")
 
@@ -0,0 +1,74 @@
+"""
+关键词路由测试：意图明确的实时天气/日程请求直接处理，其余交给 Agent
+
+运行: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+class WeatherRouteTest(unittest.TestCase):
+    """实时天气路由的城市名提取"""
+
+    def assertCity(self, text, city):
+        match = app._WEATHER_ROUTE.match(text)
+        self.assertIsNotNone(match, text)
+        self.assertEqual(match.group('city'), city, text)
+
+    def assertNotRouted(self, text):
+        match = app._WEATHER_ROUTE.match(text)
+        self.assertIsNone(match, f"{text} → {match and match.group('city')}")
+
+    def test_current_weather_phrasings(self):
+        self.assertCity("北京天气", "北京")
+        self.assertCity("北京今天天气", "北京")
+        self.assertCity("北京市的天气怎么样？", "北京")
+        self.assertCity("查询上海实时天气", "上海")
+        self.assertCity("请问北京天气", "北京")
+        self.assertCity("请帮我查一下乌鲁木齐的气温", "乌鲁木齐")
+        self.assertCity("聊城天气", "聊城")
+
+    def test_day_words_go_to_agent(self):
+        for text in ["北京明天天气", "北京未来三天天气", "北京这周天气", "北京最近天气",
+                     "明天天气", "北京后天的天气怎么样"]:
+            self.assertNotRouted(text)
+
+    def test_chat_phrasings_go_to_agent(self):
+        for text in ["什么是天气", "聊聊天气", "你好天气", "天气怎么样"]:
+            self.assertNotRouted(text)
+
+    def test_multiple_cities_go_to_agent(self):
+        for text in ["北京和上海的天气", "北京、上海天气", "北京跟上海天气"]:
+            self.assertNotRouted(text)
+
+
+class RouteMessageTest(unittest.TestCase):
+    """route_message 的分发结果"""
+
+    def test_schedule(self):
+        routed = app.route_message("请问技术部的日程")
+        self.assertIsNotNone(routed)
+        self.assertEqual(routed["data"]["query_department"], "技术部")
+
+    def test_weather_calls_mcp_with_city(self):
+        client = mock.Mock()
+        client.query_current_weather.return_value = {"success": True, "city": "北京市"}
+        with mock.patch.object(app, "get_mcp_client", return_value=client):
+            routed = app.route_message("请问北京天气")
+        client.query_current_weather.assert_called_once_with("北京")
+        self.assertEqual(routed["weather"]["city"], "北京市")
+
+    def test_forecast_does_not_call_mcp(self):
+        with mock.patch.object(app, "get_mcp_client") as get_client:
+            self.assertIsNone(app.route_message("北京明天天气"))
+        get_client.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()